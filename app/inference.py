@@ -1,22 +1,75 @@
 import onnxruntime as ort
 import numpy as np
-from .utils import preprocess_audio, load_token_map, decode_tokens
+from .utils import _executor, preprocess_audio, read_token_map, build_token_array, decode_tokens, AudioSource, N_MELS, MAX_FRAMES
 import asyncio
+import atexit
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import threading
 import os
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Time downsampling of the conformer encoder (input frames per output frame)
+_SUBSAMPLING_FACTOR = 4
+
+def _round_up_frames(frames: int) -> int:
+    """Round a frame count up to a multiple of the encoder subsampling factor"""
+    return -(-frames // _SUBSAMPLING_FACTOR) * _SUBSAMPLING_FACTOR
+
+# Time-axis lengths that mel inputs are zero-padded to, so kernels are selected once per bucket.
+# Each is a multiple of the subsampling factor so padding never leaks into a valid output frame
+_FRAME_BUCKETS = (600, 800, _round_up_frames(MAX_FRAMES))
+
+# Concurrent requests are coalesced into one session run of up to this many inputs
+_MAX_BATCH_SIZE = 8
+_BATCH_WINDOW = 0.01  # seconds to wait for more requests after the first one arrives
+
+# Upper bound on distinct input shapes kept as pre-allocated device buffers
+_MAX_POOLED_INPUTS = len(_FRAME_BUCKETS) * _MAX_BATCH_SIZE
+
+# Forward passes per bucket run at startup to absorb allocator and kernel selection cost
+_WARMUP_RUNS = 2
+
+# Heuristic cuDNN algo search avoids the exhaustive per-shape search on first runs
+def _trt_profile_shapes(batch_size: int, frames: int) -> str:
+    """Format a TensorRT optimization profile entry for the exported model inputs"""
+    return f"audio_signal:{batch_size}x{N_MELS}x{frames},length:{batch_size}"
+
+CUDA_PROVIDER_OPTIONS = {
+    'cudnn_conv_algo_search': 'DEFAULT',
+    'cudnn_conv_use_max_workspace': '1',
+    'do_copy_in_default_stream': '1',
+    'arena_extend_strategy': 'kSameAsRequested',
+}
+
+def _register_shared_cpu_arena() -> bool:
+    """Register a process-wide CPU arena that sessions can share via env allocators"""
+    try:
+        mem_info = ort.OrtMemoryInfo("Cpu", ort.OrtAllocatorType.ORT_ARENA_ALLOCATOR, 0, ort.OrtMemType.DEFAULT)
+        ort.create_and_register_allocator(mem_info, ort.OrtArenaCfg(0, -1, -1, -1))
+        return True
+    except Exception as e:
+        logger.warning(f"Shared CPU arena unavailable, using per-session arenas: {str(e)}")
+        return False
+
+_shared_cpu_arena = _register_shared_cpu_arena()
+
 class ASRInference:
     """Async-compatible ASR inference class using ONNX Runtime"""
     
     def __init__(self, model_path: str = "model/stt_hi_conformer_ctc_medium.onnx"):
         self.model_path = model_path
         self.session: Optional[ort.InferenceSession] = None
-        self.token_map: Optional[dict] = None
-        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.token_map: Dict[int, str] = {}
+        self._io_binding: Optional[ort.IOBinding] = None
+        self._binding_lock = threading.Lock()
+        self._input_pool: Dict[Tuple[int, ...], ort.OrtValue] = {}
+        self._padded_inputs: Dict[Tuple[int, int], np.ndarray] = {}
+        self._batch_queue: Optional[asyncio.Queue] = None
+        self._batch_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._batch_task: Optional[asyncio.Task] = None
+        self._argmax_buf = np.empty((1, MAX_FRAMES), dtype=np.intp)
         self._initialize_model()
     
     def _initialize_model(self):
@@ -27,80 +80,227 @@ class ASRInference:
             
             # Configure ONNX Runtime for optimal performance
             session_options = ort.SessionOptions()
-            session_options.inter_op_num_threads = 2
+            session_options.inter_op_num_threads = 1
             session_options.intra_op_num_threads = 2
             session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
             
+            # Inputs are padded to a few fixed shapes, so memory patterns can be planned and reused
+            session_options.enable_mem_pattern = True
+            session_options.enable_cpu_mem_arena = True
+            if _shared_cpu_arena:
+                session_options.add_session_config_entry('session.use_env_allocators', '1')
+            
             providers = ['CPUExecutionProvider']
-            if ort.get_available_providers():
-                available_providers = ort.get_available_providers()
-                if 'CUDAExecutionProvider' in available_providers:
-                    providers.insert(0, 'CUDAExecutionProvider')
+            available_providers = ort.get_available_providers()
+            if 'CUDAExecutionProvider' in available_providers:
+                providers.insert(0, ('CUDAExecutionProvider', CUDA_PROVIDER_OPTIONS))
+                if 'TensorrtExecutionProvider' in available_providers:
+                    # Cache built engines next to the model so restarts skip the TRT build.
+                    # One profile covers every batch size and bucket the batcher can send,
+                    # so new batch shapes don't trigger an engine rebuild under live traffic
+                    providers.insert(0, ('TensorrtExecutionProvider', {
+                        'trt_fp16_enable': '1',
+                        'trt_engine_cache_enable': '1',
+                        'trt_engine_cache_path': os.path.join(os.path.dirname(self.model_path), 'trt_cache'),
+                        'trt_profile_min_shapes': _trt_profile_shapes(1, _FRAME_BUCKETS[0]),
+                        'trt_profile_opt_shapes': _trt_profile_shapes(1, _FRAME_BUCKETS[-1]),
+                        'trt_profile_max_shapes': _trt_profile_shapes(_MAX_BATCH_SIZE, _FRAME_BUCKETS[-1]),
+                    }))
+            
+            # Prefer the INT8 model (see model/quantize_onnx.py) when running on CPU only
+            session_model_path = self.model_path
+            int8_model_path = os.path.splitext(self.model_path)[0] + ".int8.onnx"
+            if 'CUDAExecutionProvider' not in available_providers and os.path.exists(int8_model_path):
+                session_model_path = int8_model_path
             
             self.session = ort.InferenceSession(
-                self.model_path,
+                session_model_path,
                 sess_options=session_options,
                 providers=providers
             )
             
-            logger.info(f"Model loaded successfully with providers: {self.session.get_providers()}")
+            logger.info(f"Model loaded successfully from {session_model_path} with providers: {self.session.get_providers()}")
             logger.info(f"Model inputs: {[inp.name for inp in self.session.get_inputs()]}")
             logger.info(f"Model outputs: {[out.name for out in self.session.get_outputs()]}")
             
+            # IO binding lets CUDA runs reuse device buffers instead of copying per call
+            self._input_names = [inp.name for inp in self.session.get_inputs()]
+            self._output_names = [out.name for out in self.session.get_outputs()]
+            self._use_cuda = 'CUDAExecutionProvider' in self.session.get_providers()
+            self._io_binding = self.session.io_binding()
+            if self._use_cuda:
+                for bucket in _FRAME_BUCKETS:
+                    self._get_device_input((1, N_MELS, bucket))
+            
+            self._warmup()
+            
+            # Token map is tiny and fixed, so load it once together with the model
+            self.token_map = read_token_map(os.path.join(os.path.dirname(self.model_path), "tokens.txt"))
+            if self.token_map:
+                build_token_array(self.token_map)
+            
         except Exception as e:
             logger.error(f"Failed to initialize model: {str(e)}")
             raise
     
+    def _warmup(self):
+        """Run dummy inferences so the first real request does not pay one-time setup costs"""
+        for bucket in _FRAME_BUCKETS:
+            dummy_input = np.zeros((1, N_MELS, bucket), dtype=np.float32)
+            dummy_length = np.array([bucket], dtype=np.int64)
+            for _ in range(_WARMUP_RUNS):
+                self._run_with_binding([dummy_input], dummy_length)
+        logger.info(f"Model warmed up for input lengths: {list(_FRAME_BUCKETS)}")
+    
+    def _get_device_input(self, shape: Tuple[int, ...]) -> ort.OrtValue:
+        """Get a pooled CUDA input buffer for the given shape"""
+        ort_input = self._input_pool.get(shape)
+        if ort_input is None:
+            if len(self._input_pool) >= _MAX_POOLED_INPUTS:
+                self._input_pool.pop(next(iter(self._input_pool)))
+            ort_input = ort.OrtValue.ortvalue_from_shape_and_type(shape, np.float32, 'cuda', 0)
+            self._input_pool[shape] = ort_input
+        return ort_input
+    
+    def _pad_batch(self, input_tensors: List[np.ndarray]) -> np.ndarray:
+        """Zero-pad (1, n_mels, T) inputs into one (B, n_mels, bucket) array, reusing a persistent buffer"""
+        batch_size = len(input_tensors)
+        max_frames = max(tensor.shape[2] for tensor in input_tensors)
+        bucket = next((b for b in _FRAME_BUCKETS if b >= max_frames), None)
+        
+        if bucket is None:
+            if batch_size == 1:
+                return input_tensors[0]
+            padded = np.zeros((batch_size, N_MELS, _round_up_frames(max_frames)), dtype=np.float32)
+        else:
+            padded = self._padded_inputs.get((batch_size, bucket))
+            if padded is None:
+                padded = np.zeros((batch_size, N_MELS, bucket), dtype=np.float32)
+                self._padded_inputs[(batch_size, bucket)] = padded
+        
+        for i, tensor in enumerate(input_tensors):
+            frames = tensor.shape[2]
+            np.copyto(padded[i, :, :frames], tensor[0])
+            padded[i, :, frames:] = 0.0
+        return padded
+    
+    def _run_with_binding(self, input_tensors: List[np.ndarray], input_lengths: np.ndarray) -> List[np.ndarray]:
+        """Run one batched forward pass through the shared IO binding and split the logits per input"""
+        with self._binding_lock:
+            # Padded buffers are shared, so they are only touched while holding the lock
+            model_input = self._pad_batch(input_tensors)
+            
+            binding = self._io_binding
+            binding.clear_binding_inputs()
+            binding.clear_binding_outputs()
+            
+            device = 'cuda' if self._use_cuda else 'cpu'
+            if self._use_cuda:
+                ort_input = self._get_device_input(model_input.shape)
+                ort_input.update_inplace(np.ascontiguousarray(model_input))
+                binding.bind_ortvalue_input(self._input_names[0], ort_input)
+            else:
+                binding.bind_cpu_input(self._input_names[0], model_input)
+            binding.bind_cpu_input(self._input_names[1], input_lengths)
+            for name in self._output_names:
+                binding.bind_output(name, device)
+            
+            self.session.run_with_iobinding(binding)
+            outputs = binding.copy_outputs_to_cpu()
+        
+        logits = outputs[0]
+        encoded_lengths = outputs[1].reshape(-1) if len(outputs) > 1 and outputs[1].ndim == 1 else None
+        
+        # Drop output frames that only cover padding
+        results = []
+        for i, tensor in enumerate(input_tensors):
+            if encoded_lengths is not None:
+                valid_frames = int(encoded_lengths[i])
+            else:
+                # Exact for padded lengths that are multiples of the subsampling factor: ceil(T / 4)
+                valid_frames = -(-tensor.shape[2] * logits.shape[1] // model_input.shape[2])
+            results.append(logits[i:i + 1, :valid_frames])
+        return results
+    
+    def _get_batch_queue(self) -> asyncio.Queue:
+        """Get the request queue, starting the batching task on the running event loop if needed"""
+        loop = asyncio.get_running_loop()
+        if self._batch_queue is None or self._batch_loop is not loop:
+            self._batch_queue = asyncio.Queue()
+            self._batch_loop = loop
+            self._batch_task = loop.create_task(self._batch_worker(self._batch_queue))
+        return self._batch_queue
+    
+    async def _batch_worker(self, queue: asyncio.Queue):
+        """Collect queued requests for a short window and run them as a single batch"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + _BATCH_WINDOW
+            while len(batch) < _MAX_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            input_tensors, input_lengths, futures = zip(*batch)
+            try:
+                results = await loop.run_in_executor(
+                    _executor, 
+                    self._run_with_binding, 
+                    list(input_tensors), 
+                    np.concatenate(input_lengths)
+                )
+                for future, logits in zip(futures, results):
+                    if not future.done():
+                        future.set_result(logits)
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+    
     async def _run_inference(self, input_tensor: np.ndarray, input_length: np.ndarray) -> np.ndarray:
         """Run inference asynchronously"""
         try:
-            # Prepare inputs
-            ort_inputs = {
-                self.session.get_inputs()[0].name: input_tensor,
-                self.session.get_inputs()[1].name: input_length,
-            }
-            
-            # Run inference in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            ort_outputs = await loop.run_in_executor(
-                self.executor, 
-                self.session.run, 
-                None, 
-                ort_inputs
-            )
-            
-            return ort_outputs[0]
+            # Hand the input to the batching task and wait for this request's logits
+            future = asyncio.get_running_loop().create_future()
+            self._get_batch_queue().put_nowait((input_tensor, input_length, future))
+            return await future
             
         except Exception as e:
             logger.error(f"Inference failed: {str(e)}")
             raise
     
-    async def transcribe(self, audio_path: str) -> str:
+    async def transcribe(self, audio: AudioSource) -> str:
         """
         Transcribe audio file to text
         
         Args:
-            audio_path: Path to audio file
+            audio: Path to audio file or its raw bytes
             
         Returns:
             Transcribed text
         """
         try:
-            input_tensor = await preprocess_audio(audio_path)
+            input_tensor = await preprocess_audio(audio)
             input_length = np.array([input_tensor.shape[2]], dtype=np.int64)
             
             logger.info(f"Input tensor shape: {input_tensor.shape}")
             
             logits = await self._run_inference(input_tensor, input_length)
             
-            # Decode predictions
-            decoded_ids = np.argmax(logits, axis=-1).squeeze()
-            
-            if self.token_map is None:
-                self.token_map = await load_token_map("model/tokens.txt")
+            # Decode predictions into the reused buffer; intp is argmax's native type, so no temporary is made
+            frames = logits.shape[1]
+            if frames > self._argmax_buf.shape[1]:
+                self._argmax_buf = np.empty((1, frames), dtype=np.intp)
+            decoded_ids = self._argmax_buf[:, :frames]
+            np.argmax(logits, axis=-1, out=decoded_ids)
             
             # Convert tokens to text
-            transcription = decode_tokens(decoded_ids, self.token_map)
+            transcription = decode_tokens(decoded_ids[0], self.token_map)
             
             # Post-process transcription
             transcription = self._post_process_text(transcription)
@@ -119,31 +319,49 @@ class ASRInference:
             return "[No speech detected]"
         
         return text.strip()
-    
-    def __del__(self):
-        """Cleanup resources"""
-        if hasattr(self, 'executor'):
-            self.executor.shutdown(wait=False)
 
 
 _inference_instance: Optional[ASRInference] = None
+_instance_lock = threading.Lock()
 
 def get_inference_instance() -> ASRInference:
     """Get singleton inference instance"""
     global _inference_instance
     if _inference_instance is None:
-        _inference_instance = ASRInference()
+        with _instance_lock:
+            if _inference_instance is None:
+                _inference_instance = ASRInference()
     return _inference_instance
 
-async def transcribe_audio(audio_path: str) -> str:
+async def initialize_model() -> ASRInference:
+    """
+    Load the singleton inference instance without blocking the event loop
+    
+    Returns:
+        The shared ASRInference, created on first call and reused afterwards
+    """
+    if _inference_instance is not None:
+        return _inference_instance
+    return await asyncio.to_thread(get_inference_instance)
+
+def _release_session():
+    """Drop the ORT session at interpreter exit"""
+    if _inference_instance is not None:
+        _inference_instance._io_binding = None
+        _inference_instance.session = None
+
+atexit.register(_release_session)
+
+async def transcribe_audio(audio: AudioSource) -> str:
     """
     Main transcription function
     
     Args:
-        audio_path: Path to audio file
+        audio: Path to audio file or its raw bytes
         
     Returns:
         Transcribed text
     """
-    inference = get_inference_instance()
-    return await inference.transcribe(audio_path)
\ No newline at end of file
+    # Loads off the event loop if the startup hook could not create the model
+    inference = await initialize_model()
+    return await inference.transcribe(audio)
\ No newline at end of file
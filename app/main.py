@@ -1,42 +1,52 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-import tempfile
 import os
 import logging
 import time
+from collections import Counter
+from contextlib import asynccontextmanager
 from typing import Dict, Any
-from .inference import transcribe_audio
-from .utils import validate_audio, cleanup_temp_file
+from .inference import transcribe_audio, initialize_model
+from .utils import validate_audio
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load and warm up the model before the server starts accepting requests"""
+    try:
+        await initialize_model()
+    except Exception as e:
+        logger.error(f"Model initialization at startup failed: {str(e)}")
+    yield
+
 app = FastAPI(
     title="NeMo ASR Transcription Service",
     description="A FastAPI-based Automatic Speech Recognition service using NVIDIA NeMo",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
-# Add CORS middleware for cross-origin requests
+# Add CORS middleware for cross-origin requests (credentials cannot be combined with a wildcard origin)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
-    allow_credentials=True,
+    allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-# Global statistics for monitoring
-stats = {
-    "total_requests": 0,
-    "successful_transcriptions": 0,
-    "failed_transcriptions": 0,
-    "average_processing_time": 0.0
-}
+# Upload limits
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Global statistics for monitoring; the average is derived on read from the running total
+stats = Counter()
 
 @app.get("/")
 async def root():
@@ -63,11 +73,23 @@ async def health_check():
 @app.get("/stats")
 async def get_stats():
     """Get service statistics"""
-    return stats
+    successful = stats["successful_transcriptions"]
+    return {
+        "total_requests": stats["total_requests"],
+        "successful_transcriptions": successful,
+        "failed_transcriptions": stats["failed_transcriptions"],
+        "average_processing_time": stats["total_processing_time"] / successful if successful else 0.0
+    }
+
+def raise_file_too_large():
+    """Reject an upload that exceeds MAX_FILE_SIZE"""
+    raise HTTPException(
+        status_code=400,
+        detail="File too large. Maximum size is 10MB."
+    )
 
 @app.post("/transcribe")
 async def transcribe(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(..., description="WAV audio file (5-10 seconds, 16kHz)")
 ) -> JSONResponse:
     """
@@ -83,7 +105,6 @@ async def transcribe(
         HTTPException: For invalid files or processing errors
     """
     start_time = time.time()
-    temp_file_path = None
     
     try:
         # Update request statistics
@@ -102,23 +123,24 @@ async def transcribe(
                 detail="Only .wav files are supported"
             )
         
-        # Check file size (max 10MB)
-        content = await file.read()
-        if len(content) > 10 * 1024 * 1024:  # 10MB
-            raise HTTPException(
-                status_code=400,
-                detail="File too large. Maximum size is 10MB."
-            )
+        # Check file size (max 10MB) while reading in chunks, stopping as soon as the limit is exceeded
+        if file.size is not None and file.size > MAX_FILE_SIZE:
+            raise_file_too_large()
         
-        logger.info(f"Processing file: {file.filename}, size: {len(content)} bytes")
+        chunks = []
+        size = 0
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > MAX_FILE_SIZE:
+                raise_file_too_large()
+        # Immutable bytes let io.BytesIO share the buffer instead of copying it on every decode
+        content = b"".join(chunks)
         
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp:
-            temp.write(content)
-            temp.flush()
-            temp_file_path = temp.name
+        logger.info(f"Processing file: {file.filename}, size: {len(content)} bytes")
         
         # Validate audio duration
-        duration_valid = await validate_audio(temp_file_path)
+        duration_valid = await validate_audio(content)
         if not duration_valid:
             raise HTTPException(
                 status_code=400,
@@ -126,23 +148,17 @@ async def transcribe(
             )
         
         # Perform transcription
-        transcription_text = await transcribe_audio(temp_file_path)
+        transcription_text = await transcribe_audio(content)
         
         # Calculate processing time
         processing_time = time.time() - start_time
         
         # Update statistics
         stats["successful_transcriptions"] += 1
-        stats["average_processing_time"] = (
-            (stats["average_processing_time"] * (stats["successful_transcriptions"] - 1) + processing_time) 
-            / stats["successful_transcriptions"]
-        )
+        stats["total_processing_time"] += processing_time
         
         logger.info(f"Transcription completed in {processing_time:.2f}s: {transcription_text}")
         
-        # Schedule cleanup
-        background_tasks.add_task(cleanup_temp_file, temp_file_path)
-        
         return JSONResponse(
             content={
                 "transcription": transcription_text,
@@ -155,13 +171,9 @@ async def transcribe(
         
     except HTTPException:
         stats["failed_transcriptions"] += 1
-        if temp_file_path:
-            background_tasks.add_task(cleanup_temp_file, temp_file_path)
         raise
     except Exception as e:
         stats["failed_transcriptions"] += 1
-        if temp_file_path:
-            background_tasks.add_task(cleanup_temp_file, temp_file_path)
         logger.error(f"Unexpected error: {str(e)}")
         raise HTTPException(
             status_code=500,
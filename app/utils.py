@@ -1,36 +1,70 @@
 import librosa
 import numpy as np
+import soundfile as sf
+import soxr
+import scipy.fft
+import scipy.signal
 import asyncio
-import aiofiles
+import io
 import os
 import logging
 from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, Tuple, Optional
+from typing import Dict, Tuple, Optional, Union, BinaryIO
+
+# Audio can be given as a file path or as the raw bytes of an uploaded file
+AudioSource = Union[str, bytes, bytearray, memoryview]
 
 logger = logging.getLogger(__name__)
 
-# Thread pool for CPU-intensive operations
-_executor = ThreadPoolExecutor(max_workers=4)
+# Thread pool for CPU-intensive operations, shared with model inference. A single worker
+# keeps preprocessing from competing with ORT's own intra-op threads
+_executor = ThreadPoolExecutor(max_workers=1)
+
+# Feature extraction parameters expected by the conformer model
+SAMPLE_RATE = 16000
+N_MELS = 80
+N_FFT = 512
+HOP_LENGTH = 160
+WIN_LENGTH = 400
+AMIN = 1e-10
+TOP_DB = 80.0
+
+# Mel frames produced by the longest accepted clip (10 s, centered framing)
+MAX_FRAMES = 10 * SAMPLE_RATE // HOP_LENGTH + 1
+
+# Mel filterbank and analysis window depend only on the fixed parameters above,
+# so build them once instead of on every request
+_MEL_FB = librosa.filters.mel(sr=SAMPLE_RATE, n_fft=N_FFT, n_mels=N_MELS).astype(np.float32)
+_HANN = scipy.signal.windows.hann(WIN_LENGTH, sym=False).astype(np.float32)
 
-async def validate_audio(path: str) -> bool:
+# Analysis window centered in an n_fft frame, matching librosa's window padding
+_HANN_NFFT = librosa.util.pad_center(_HANN, size=N_FFT)
+
+# Token strings indexed by token ID, rebuilt only when a different token map is used
+_TOKEN_ARR: Optional[np.ndarray] = None
+_TOKEN_ARR_SOURCE: Optional[Dict[int, str]] = None
+
+def _open_audio(audio: AudioSource) -> Union[str, BinaryIO]:
+    """Wrap in-memory audio in a fresh file-like object for soundfile"""
+    if isinstance(audio, str):
+        return audio
+    return io.BytesIO(audio)
+
+async def validate_audio(audio: AudioSource) -> bool:
     """
     Validate audio file duration and format
     
     Args:
-        path: Path to audio file
+        audio: Path to audio file or its raw bytes
         
     Returns:
         True if audio is valid (5-10 seconds), False otherwise
     """
     try:
-        # Load audio file asynchronously
-        y, sr = await asyncio.get_event_loop().run_in_executor(
-            _executor, 
-            lambda p: librosa.load(p, sr=16000), 
-            path
-        )
+        # Only the header is parsed, which is cheap enough to do inline
+        info = sf.info(_open_audio(audio))
         
-        duration = librosa.get_duration(y=y, sr=sr)
+        duration = info.frames / info.samplerate
         logger.info(f"Audio duration: {duration:.2f} seconds")
         
         is_valid = 5.0 <= duration <= 10.0
@@ -44,64 +78,84 @@ async def validate_audio(path: str) -> bool:
         logger.error(f"Audio validation failed: {str(e)}")
         return False
 
-async def preprocess_audio(path: str) -> np.ndarray:
+def _preprocess_sync(audio: AudioSource) -> np.ndarray:
+    """
+    Decode audio and compute normalized log-mel features
+    
+    Args:
+        audio: Path to audio file or its raw bytes
+        
+    Returns:
+        Features of shape (1, n_mels, time_steps)
+    """
+    sample_rate = SAMPLE_RATE
+    
+    samples, sr = sf.read(_open_audio(audio), dtype='float32', always_2d=False)
+    
+    # Downmix and resample only if the input deviates from the API contract
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    if sr != sample_rate:
+        samples = soxr.resample(samples, sr, sample_rate)
+    
+    logger.info(f"Loaded audio: {len(samples)} samples at {sample_rate}Hz")
+    
+    # Normalize and scale samples
+    samples = samples * 32768.0  
+    
+    # Frame the zero-padded signal as strided views (centered STFT) and apply the cached window
+    padded = np.pad(samples, N_FFT // 2, mode='constant')
+    frames = np.lib.stride_tricks.sliding_window_view(padded, N_FFT)[::HOP_LENGTH]
+    frames = frames * _HANN_NFFT
+    
+    # Power spectrum of each frame, projected onto the cached mel filterbank
+    spec = scipy.fft.rfft(frames, axis=-1, workers=1)
+    power_spec = spec.real ** 2 + spec.imag ** 2
+    mel_spec = _MEL_FB @ power_spec.T
+    
+    # Convert to log scale in place (equivalent to power_to_db with ref=np.max)
+    np.maximum(mel_spec, AMIN, out=mel_spec)
+    np.log10(mel_spec, out=mel_spec)
+    mel_spec *= 10.0
+    mel_spec -= mel_spec.max()
+    np.maximum(mel_spec, -TOP_DB, out=mel_spec)
+    
+    # Normalize features in place
+    mean = mel_spec.mean(axis=1, keepdims=True)
+    std = mel_spec.std(axis=1, keepdims=True)
+    mel_spec -= mean
+    mel_spec /= std + 1e-8
+    
+    # Add batch dimension: (1, n_mels, time_steps)
+    features = mel_spec[np.newaxis, :, :]
+    
+    logger.info(f"Preprocessed features shape: {features.shape}")
+    
+    return features.astype(np.float32, copy=False)
+
+async def preprocess_audio(audio: AudioSource) -> np.ndarray:
     """
     Preprocess audio file for ASR model inference
     
     Args:
-        path: Path to audio file
+        audio: Path to audio file or its raw bytes
         
     Returns:
         Preprocessed audio features as numpy array
     """
     try:
-        sample_rate = 16000
-        
-        # Load audio asynchronously
-        samples, _ = await asyncio.get_event_loop().run_in_executor(
+        # Decoding and feature extraction run together in a single executor call
+        return await asyncio.get_event_loop().run_in_executor(
             _executor, 
-            lambda p: librosa.load(p, sr=sample_rate), 
-            path
-        )
-        
-        logger.info(f"Loaded audio: {len(samples)} samples at {sample_rate}Hz")
-        
-        # Normalize and scale samples
-        samples = samples * 32768.0  
-        
-        # Extract mel-spectrogram features
-        mel_spec = librosa.feature.melspectrogram(
-            y=samples,
-            sr=sample_rate,
-            n_mels=80,
-            n_fft=512,
-            hop_length=160,
-            win_length=400,
-            window='hann',
-            center=True,
-            pad_mode='constant'
+            _preprocess_sync, 
+            audio
         )
         
-        # Convert to log scale
-        log_mel_spec = librosa.power_to_db(mel_spec, ref=np.max)
-        
-        # Normalize features
-        mean = log_mel_spec.mean(axis=1, keepdims=True)
-        std = log_mel_spec.std(axis=1, keepdims=True)
-        normalized_features = (log_mel_spec - mean) / (std + 1e-8)
-        
-        # Add batch dimension: (1, n_mels, time_steps)
-        features = np.expand_dims(normalized_features, axis=0)
-        
-        logger.info(f"Preprocessed features shape: {features.shape}")
-        
-        return features.astype(np.float32)
-        
     except Exception as e:
         logger.error(f"Audio preprocessing failed: {str(e)}")
         raise
 
-async def load_token_map(token_file: str = "model/tokens.txt") -> Dict[int, str]:
+def read_token_map(token_file: str = "model/tokens.txt") -> Dict[int, str]:
     """
     Load token mapping from file
     
@@ -116,19 +170,20 @@ async def load_token_map(token_file: str = "model/tokens.txt") -> Dict[int, str]
             logger.warning(f"Token file not found: {token_file}")
             return {}
         
-        token_map = {}
+        with open(token_file, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
         
-        async with aiofiles.open(token_file, 'r', encoding='utf-8') as f:
-            async for line in f:
-                line = line.strip()
-                if line:
-                    try:
-                        parts = line.split(' ', 1)
-                        if len(parts) == 2:
-                            token, idx = parts
-                            token_map[int(idx)] = token
-                    except (ValueError, IndexError) as e:
-                        logger.warning(f"Skipping invalid token line: {line}")
+        token_map = {}
+        for line in lines:
+            line = line.strip()
+            if line:
+                try:
+                    parts = line.split(' ', 1)
+                    if len(parts) == 2:
+                        token, idx = parts
+                        token_map[int(idx)] = token
+                except (ValueError, IndexError) as e:
+                    logger.warning(f"Skipping invalid token line: {line}")
         
         logger.info(f"Loaded {len(token_map)} tokens from {token_file}")
         return token_map
@@ -137,6 +192,18 @@ async def load_token_map(token_file: str = "model/tokens.txt") -> Dict[int, str]
         logger.error(f"Failed to load token map: {str(e)}")
         return {}
 
+async def load_token_map(token_file: str = "model/tokens.txt") -> Dict[int, str]:
+    """
+    Load token mapping from file without blocking the event loop
+    
+    Args:
+        token_file: Path to tokens file
+        
+    Returns:
+        Dictionary mapping token IDs to strings
+    """
+    return await asyncio.to_thread(read_token_map, token_file)
+
 def decode_tokens(token_ids: np.ndarray, token_map: Dict[int, str]) -> str:
     """
     Decode token IDs to text using CTC decoding
@@ -153,35 +220,28 @@ def decode_tokens(token_ids: np.ndarray, token_map: Dict[int, str]) -> str:
             logger.warning("Empty token map provided")
             return ""
         
+        token_arr = build_token_array(token_map)
+        
         # Get blank token ID(usually the last token)
-        blank_token_id = max(token_map.keys()) if token_map else 128
+        blank_token_id = len(token_arr) - 1
         
         # CTC decoding: remove blanks and consecutive duplicates
-        decoded_tokens = []
-        prev_token = None
-        
-        for token_id in token_ids:
-            token_id = int(token_id)
-            
-            # Skip blank tokens
-            if token_id == blank_token_id:
-                prev_token = None
-                continue
-            
-            # Skip consecutive duplicates
-            if token_id == prev_token:
-                continue
-            
-            # Add token if it exists in the map
-            if token_id in token_map:
-                decoded_tokens.append(token_map[token_id])
-            else:
-                logger.warning(f"Unknown token ID: {token_id}")
-            
-            prev_token = token_id
+        ids = np.ravel(token_ids)
+        if ids.size == 0:
+            return ""
+        
+        mask = ids != blank_token_id
+        mask[1:] &= ids[1:] != ids[:-1]
+        kept = ids[mask]
+        
+        # Drop tokens that are not in the map
+        known = (kept >= 0) & (kept < len(token_arr))
+        if not known.all():
+            logger.warning(f"Unknown token IDs: {np.unique(kept[~known]).tolist()}")
+            kept = kept[known]
         
         # Join tokens to form text
-        text = ''.join(decoded_tokens)
+        text = ''.join(token_arr[kept])
         
         logger.info(f"Decoded {len(token_ids)} tokens to: '{text}'")
         return text
@@ -190,23 +250,29 @@ def decode_tokens(token_ids: np.ndarray, token_map: Dict[int, str]) -> str:
         logger.error(f"Token decoding failed: {str(e)}")
         return ""
 
-async def cleanup_temp_file(file_path: str) -> None:
+def build_token_array(token_map: Dict[int, str]) -> np.ndarray:
     """
-    Cleanup temporary file asynchronously
+    Build a lookup array of token strings indexed by token ID
     
     Args:
-        file_path: Path to temporary file
+        token_map: Mapping from token IDs to strings
+        
+    Returns:
+        Object array where entry i is the string for token ID i
     """
-    try:
-        if file_path and os.path.exists(file_path):
-            await asyncio.get_event_loop().run_in_executor(
-                _executor,
-                os.unlink,
-                file_path
-            )
-            logger.info(f"Cleaned up temporary file: {file_path}")
-    except Exception as e:
-        logger.warning(f"Failed to cleanup temp file {file_path}: {str(e)}")
+    global _TOKEN_ARR, _TOKEN_ARR_SOURCE
+    if _TOKEN_ARR is not None and _TOKEN_ARR_SOURCE is token_map:
+        return _TOKEN_ARR
+    
+    token_arr = np.full(max(token_map.keys()) + 1, '', dtype=object)
+    for idx, token in token_map.items():
+        # Negative IDs can't come out of argmax, and would otherwise index from the end
+        if idx >= 0:
+            token_arr[idx] = token
+    
+    _TOKEN_ARR = token_arr
+    _TOKEN_ARR_SOURCE = token_map
+    return token_arr
 
 def get_audio_info(file_path: str) -> Tuple[float, int]:
     """
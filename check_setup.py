@@ -5,23 +5,71 @@ Checks if all required components are properly configured
 """
 
 import os
+import io
+import argparse
+import importlib.util
+import inspect
 import sys
 import asyncio
-from pathlib import Path
+import contextvars
 
 
-def check_file_exists(file_path, description):
+# Per-check output buffer, so checks running concurrently don't interleave their output
+_check_output = contextvars.ContextVar("_check_output", default=None)
+
+
+class BufferedStdout:
+    """Stdout proxy that writes into the current check's buffer when one is set"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        buffer = _check_output.get()
+        if buffer is None:
+            return self._stream.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        self._stream.flush()
+
+    def __getattr__(self, name):
+        # Everything else (encoding, isatty, fileno, ...) comes from the real stream
+        return getattr(self._stream, name)
+
+
+def scan_model_dir(model_dir="model"):
+    """Snapshot the model directory once; DirEntry objects cache their stat results"""
+    try:
+        return {entry.name: entry for entry in os.scandir(model_dir)}
+    except OSError:
+        # Missing, not a directory, or unreadable: report the model files as missing
+        return None
+
+
+def check_file_exists(file_path, description, model_entries=None):
     """Check if a required file exists"""
-    if os.path.exists(file_path):
-        file_size = os.path.getsize(file_path)
-        print(f"✓ {description}: {file_path} ({file_size:,} bytes)")
-        return True
-    else:
+    # Files in the model directory are looked up in the scandir snapshot when one is given
+    # A single stat gives both existence and size; any OSError counts as missing, like os.path.exists
+    directory, name = os.path.split(file_path)
+    try:
+        if directory == "model" and model_entries is not None:
+            entry = model_entries.get(name)
+            file_size = entry.stat().st_size if entry is not None else None
+        else:
+            file_size = os.stat(file_path).st_size
+    except OSError:
+        file_size = None
+    
+    if file_size is None:
         print(f"✗ {description}: {file_path} - NOT FOUND")
         return False
+    
+    print(f"✓ {description}: {file_path} ({file_size:,} bytes)")
+    return True
 
 
-def check_directory_structure():
+def check_directory_structure(model_entries=None):
     """Validate project directory structure"""
     print("=== Directory Structure Check ===")
     
@@ -41,14 +89,14 @@ def check_directory_structure():
     
     all_good = True
     for file_path, description in required_files:
-        if not check_file_exists(file_path, description):
+        if not check_file_exists(file_path, description, model_entries):
             all_good = False
     
     return all_good
 
 
 def check_python_imports():
-    """Check if all required Python packages can be imported"""
+    """Check if all required Python packages are installed, without importing them"""
     print("\n=== Python Dependencies Check ===")
     
     required_packages = [
@@ -56,39 +104,52 @@ def check_python_imports():
         ("uvicorn", "ASGI server"),
         ("onnxruntime", "ONNX Runtime"),
         ("librosa", "Audio processing"),
+        ("soundfile", "Audio decoding"),
+        ("soxr", "Audio resampling"),
+        ("scipy", "Signal processing"),
         ("numpy", "Numerical computing"),
-        ("aiofiles", "Async file operations"),
         ("pydantic", "Data validation"),
     ]
     
     all_good = True
     for package, description in required_packages:
-        try:
-            __import__(package)
+        # find_spec only locates the package, so heavy imports such as librosa/numba are not executed
+        if importlib.util.find_spec(package) is not None:
             print(f"✓ {package}: {description}")
-        except ImportError:
+        else:
             print(f"✗ {package}: {description} - NOT AVAILABLE")
             all_good = False
     
     return all_good
 
 
-def check_model_files():
+def count_lines(file_path):
+    """Count lines in a file in fixed-size binary chunks, without decoding or storing them"""
+    count = 0
+    last_byte = b"\n"
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            count += chunk.count(b"\n")
+            last_byte = chunk[-1:]
+    # A final line without a trailing newline still counts
+    return count + (last_byte != b"\n")
+
+
+def check_model_files(model_entries):
     """Validate model files"""
     print("\n=== Model Files Check ===")
     
-    model_dir = Path("model")
-    if not model_dir.exists():
+    if model_entries is None:
         print("✗ Model directory not found")
         return False
     
-    onnx_file = model_dir / "stt_hi_conformer_ctc_medium.onnx"
-    tokens_file = model_dir / "tokens.txt"
+    onnx_file = model_entries.get("stt_hi_conformer_ctc_medium.onnx")
+    tokens_file = model_entries.get("tokens.txt")
     
     all_good = True
     
     # Check ONNX model
-    if onnx_file.exists():
+    if onnx_file is not None:
         size_mb = onnx_file.stat().st_size / (1024 * 1024)
         print(f"✓ ONNX model: {size_mb:.1f} MB")
     else:
@@ -96,10 +157,8 @@ def check_model_files():
         all_good = False
     
     # Check tokens file
-    if tokens_file.exists():
-        with open(tokens_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        print(f"✓ Tokens file: {len(lines)} tokens")
+    if tokens_file is not None:
+        print(f"✓ Tokens file: {count_lines(tokens_file.path)} tokens")
     else:
         print("✗ Tokens file missing")
         all_good = False
@@ -107,7 +166,7 @@ def check_model_files():
     return all_good
 
 
-async def test_audio_processing():
+async def test_audio_processing(model_entries):
     """Test audio processing pipeline"""
     print("\n=== Audio Processing Test ===")
     
@@ -115,8 +174,9 @@ async def test_audio_processing():
         from app.utils import preprocess_audio, load_token_map
         
         # Test token map loading
-        if os.path.exists("model/tokens.txt"):
-            token_map = await load_token_map()
+        tokens_file = model_entries.get("tokens.txt") if model_entries is not None else None
+        if tokens_file is not None:
+            token_map = await load_token_map(tokens_file.path)
             print(f"✓ Token map loaded: {len(token_map)} tokens")
         else:
             print("✗ Cannot test token loading - tokens.txt missing")
@@ -137,6 +197,40 @@ async def test_audio_processing():
         return False
 
 
+async def check_padding_consistency(inference):
+    """Check that bucket-padded (and batched) inference decodes to the same text as an unpadded run"""
+    import numpy as np
+    from app.utils import preprocess_audio, decode_tokens
+    
+    sample_files = [path for path in ("audio/sample.wav", "audio/sample10.wav") if os.path.exists(path)]
+    if not sample_files:
+        print("ℹ Sample audio not found - skipping padding consistency test")
+        return True
+    
+    features = [await preprocess_audio(path) for path in sample_files]
+    lengths = [np.array([f.shape[2]], dtype=np.int64) for f in features]
+    
+    input_names = [inp.name for inp in inference.session.get_inputs()]
+    unpadded = [
+        inference.session.run(None, {input_names[0]: f, input_names[1]: l})[0]
+        for f, l in zip(features, lengths)
+    ]
+    # Submitted together, so the batcher pads them into a single run
+    padded = await asyncio.gather(*(inference._run_inference(f, l) for f, l in zip(features, lengths)))
+    
+    all_good = True
+    for path, ref, out in zip(sample_files, unpadded, padded):
+        ref_text = decode_tokens(np.argmax(ref, axis=-1)[0], inference.token_map)
+        out_text = decode_tokens(np.argmax(out, axis=-1)[0], inference.token_map)
+        if ref.shape == out.shape and ref_text == out_text:
+            print(f"✓ Padded inference matches unpadded: {path}")
+        else:
+            print(f"✗ Padded inference differs from unpadded: {path} ({out.shape} vs {ref.shape})")
+            all_good = False
+    
+    return all_good
+
+
 async def test_model_loading():
     """Test ONNX model loading"""
     print("\n=== Model Loading Test ===")
@@ -144,9 +238,10 @@ async def test_model_loading():
     try:
         from app.inference import initialize_model
         
-        await initialize_model()
+        inference = await initialize_model()
         print("✓ ONNX model loaded successfully")
-        return True
+        
+        return await check_padding_consistency(inference)
         
     except Exception as e:
         print(f"✗ Model loading failed: {e}")
@@ -174,19 +269,55 @@ def print_usage_instructions():
     print('    -F "file=@audio/sample.wav"')
 
 
-async def main():
+async def run_check(check, *args):
+    """Run a sync (in a thread) or async check and capture what it prints"""
+    buffer = io.StringIO()
+    _check_output.set(buffer)
+    try:
+        if inspect.iscoroutinefunction(check):
+            result = await check(*args)
+        else:
+            result = await asyncio.to_thread(check, *args)
+    except Exception as e:
+        print(f"✗ {check.__name__} raised an unexpected error: {e}")
+        result = False
+    return result, buffer.getvalue()
+
+
+async def main(deep=False):
     """Run all validation checks"""
     print("FastAPI ASR Service - Setup Validation")
     print("=" * 50)
     
-    checks = [
-        ("Directory Structure", check_directory_structure()),
-        ("Python Dependencies", check_python_imports()),
-        ("Model Files", check_model_files()),
-        ("Audio Processing", await test_audio_processing()),
-        ("Model Loading", await test_model_loading()),
+    # One directory scan shared by every check that looks at model files
+    model_entries = scan_model_dir()
+    
+    check_functions = [
+        ("Directory Structure", check_directory_structure, model_entries),
+        ("Python Dependencies", check_python_imports),
+        ("Model Files", check_model_files, model_entries),
+        ("Audio Processing", test_audio_processing, model_entries),
     ]
     
+    # Creating the ONNX session is the expensive step, so it only runs when asked for
+    if deep:
+        check_functions.append(("Model Loading", test_model_loading))
+    else:
+        print("ℹ Model loading test skipped (run with --deep to include it)")
+    
+    # Checks are independent, so run them concurrently and print their output in order afterwards
+    stdout = sys.stdout
+    sys.stdout = BufferedStdout(stdout)
+    try:
+        outcomes = await asyncio.gather(*(run_check(*check[1:]) for check in check_functions))
+    finally:
+        sys.stdout = stdout
+    
+    checks = []
+    for (check_name, *_), (result, output) in zip(check_functions, outcomes):
+        print(output, end="")
+        checks.append((check_name, result))
+    
     print("\n" + "=" * 50)
     print("Validation Summary")
     print("=" * 50)
@@ -209,5 +340,9 @@ async def main():
 
 
 if __name__ == "__main__":
-    success = asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Validate the FastAPI ASR service setup")
+    parser.add_argument("--deep", action="store_true", help="also load the ONNX model")
+    args = parser.parse_args()
+    
+    success = asyncio.run(main(deep=args.deep))
     sys.exit(0 if success else 1)
\ No newline at end of file
@@ -1,6 +1,48 @@
 from nemo.collections.asr.models import EncDecCTCModel
 import nemo.collections.asr as nemo_asr
+import inspect
 import os
+import torch
+
+def is_up_to_date(source_path, output_paths):
+    """Check that every output exists and is at least as new as the source"""
+    source_mtime = os.stat(source_path).st_mtime
+    for path in output_paths:
+        try:
+            if os.stat(path).st_mtime < source_mtime:
+                return False
+        except FileNotFoundError:
+            return False
+    return True
+
+def export_with_torch(model, output_path):
+    """Fallback export through torch.onnx when NeMo's own exporter fails"""
+    print("Attempting manual PyTorch ONNX export...")
+    
+    # Create dummy inputs matching the model's expected input format
+    batch_size = 1
+    seq_len = 16000  # 1 second of audio at 16kHz
+    
+    dummy_audio = torch.randn(batch_size, seq_len)
+    dummy_length = torch.tensor([seq_len], dtype=torch.long)
+    
+    # Manual export using PyTorch
+    torch.onnx.export(
+        model,
+        (dummy_audio, dummy_length),
+        output_path,
+        input_names=["audio_signal", "length"],
+        output_names=["logits"],
+        dynamic_axes={
+            "audio_signal": {0: "batch_size", 1: "time"},
+            "length": {0: "batch_size"},
+            "logits": {0: "batch_size", 1: "time"}
+        },
+        opset_version=17,  # native LayerNormalization
+        do_constant_folding=True,
+        export_params=True,
+        verbose=bool(os.environ.get("ONNX_EXPORT_VERBOSE"))  # graph dump is opt-in
+    )
 
 def export():
     model_path = "stt_hi_conformer_ctc_medium.nemo"
@@ -9,70 +51,53 @@ def export():
         print(f"Error: Model file not found at {model_path}")
         return
     
-    model = nemo_asr.models.EncDecCTCModel.restore_from(restore_path=model_path)
-    model.eval()
+    # Skip the expensive restore + trace when both artifacts are newer than the .nemo file
+    if is_up_to_date(model_path, ["stt_hi_conformer_ctc_medium.onnx", "tokens.txt"]):
+        print("✓ ONNX model and tokens file are up to date, skipping export")
+        return
+    
+    # Tracing only needs the forward path, so load on CPU and drop training-only modules
+    model = nemo_asr.models.EncDecCTCModel.restore_from(restore_path=model_path, map_location=torch.device("cpu"))
+    model.freeze()
+    model.encoder.eval()
+    model.decoder.eval()
+    if hasattr(model, "loss"):
+        del model.loss
+    
+    onnx_path = "stt_hi_conformer_ctc_medium.onnx"
     
-    # Fix the export method call - use the correct parameter name
+    # Pick the export call the installed NeMo version supports instead of retrying each variant
     try:
-        # Method 1: Try with just output parameter
-        model.export(output="stt_hi_conformer_ctc_medium.onnx")
-        print("✓ Successfully exported using basic 'output' parameter")
+        if "check_trace" in inspect.signature(model.export).parameters:
+            model.export(output=onnx_path, check_trace=False)
+            print("✓ Successfully exported with check_trace=False")
+        else:
+            model.export(output=onnx_path)
+            print("✓ Successfully exported using basic 'output' parameter")
     except Exception as e:
-        print(f"Method 1 failed: {e}")
+        print(f"NeMo export failed: {e}")
         try:
-            # Method 2: Try with check_trace parameter
-            model.export(output="stt_hi_conformer_ctc_medium.onnx", check_trace=False)
-            print("✓ Successfully exported with check_trace=False")
+            export_with_torch(model, onnx_path)
+            print("✓ Successfully exported using manual PyTorch ONNX export")
         except Exception as e2:
-            print(f"Method 2 failed: {e2}")
-            try:
-                # Method 3: Use manual PyTorch ONNX export
-                print("Attempting manual PyTorch ONNX export...")
-                import torch
-                
-                # Create dummy inputs matching the model's expected input format
-                batch_size = 1
-                seq_len = 16000  # 1 second of audio at 16kHz
-                
-                dummy_audio = torch.randn(batch_size, seq_len)
-                dummy_length = torch.tensor([seq_len], dtype=torch.long)
-                
-                # Manual export using PyTorch
-                torch.onnx.export(
-                    model,
-                    (dummy_audio, dummy_length),
-                    "stt_hi_conformer_ctc_medium.onnx",
-                    input_names=["audio_signal", "length"],
-                    output_names=["logits"],
-                    dynamic_axes={
-                        "audio_signal": {0: "batch_size", 1: "time"},
-                        "length": {0: "batch_size"},
-                        "logits": {0: "batch_size", 1: "time"}
-                    },
-                    opset_version=11,
-                    verbose=True
-                )
-                print("✓ Successfully exported using manual PyTorch ONNX export")
-                
-            except Exception as e3:
-                print(f"All export methods failed: {e3}")
-                print("Error details:", str(e3))
-                return
+            print(f"All export methods failed: {e2}")
+            print("Error details:", str(e2))
+            return
     
     try:
-        with open("tokens.txt", "w", encoding='utf-8') as f:
-            # Handle both vocabulary types
-            if hasattr(model.decoder, 'vocabulary'):
-                vocab = model.decoder.vocabulary
-            elif hasattr(model, 'tokenizer') and hasattr(model.tokenizer, 'vocab'):
-                vocab = list(model.tokenizer.vocab.keys())
-            else:
-                print("Warning: Could not find vocabulary")
-                vocab = []
-            
-            for i, s in enumerate(vocab):
-                f.write(f"{s} {i}\n")
-            f.write(f"<blk> {len(vocab)}\n")
+        # Handle both vocabulary types
+        if hasattr(model.decoder, 'vocabulary'):
+            vocab = model.decoder.vocabulary
+        elif hasattr(model, 'tokenizer') and hasattr(model.tokenizer, 'vocab'):
+            vocab = list(model.tokenizer.vocab.keys())
+        else:
+            print("Warning: Could not find vocabulary")
+            vocab = []
+        
+        # Build the whole file in memory and write it in one call
+        payload = "".join([f"{s} {i}\n" for i, s in enumerate(vocab)]) + f"<blk> {len(vocab)}\n"
+        with open("tokens.txt", "w", encoding='utf-8', buffering=1 << 20) as f:
+            f.write(payload)
         
         print(f"✓ Tokens file created with {len(vocab)} tokens")
         
@@ -0,0 +1,29 @@
+from onnxruntime.quantization import quantize_dynamic, QuantType
+import os
+
+def quantize():
+    model_path = "stt_hi_conformer_ctc_medium.onnx"
+    output_path = "stt_hi_conformer_ctc_medium.int8.onnx"
+
+    if not os.path.exists(model_path):
+        print(f"Error: Model file not found at {model_path}")
+        return
+
+    try:
+        # Dynamic INT8 quantization of the matmul-heavy conformer blocks for the CPU path
+        quantize_dynamic(
+            model_path,
+            output_path,
+            weight_type=QuantType.QInt8,
+            op_types_to_quantize=["MatMul", "Attention"]
+        )
+
+        fp32_mb = os.path.getsize(model_path) / (1024 * 1024)
+        int8_mb = os.path.getsize(output_path) / (1024 * 1024)
+        print(f"✓ Quantized model saved to {output_path} ({fp32_mb:.1f} MB -> {int8_mb:.1f} MB)")
+
+    except Exception as e:
+        print(f"Quantization failed: {e}")
+
+if __name__ == "__main__":
+    quantize()